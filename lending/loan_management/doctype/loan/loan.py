@@ -348,7 +348,7 @@ def request_loan_closure(loan, posting_date=None, auto_close_loan=0):
 	)
 
 	loan_product = frappe.get_value("Loan", loan, "loan_product")
-	write_off_limit = frappe.get_value("Loan Product", loan_product, "write_off_amount")
+	write_off_limit = frappe.get_cached_value("Loan Product", loan_product, "write_off_amount")
 
 	if pending_amount and abs(pending_amount) < write_off_limit:
 		# Auto create loan write off and update status as loan closure requested
@@ -437,7 +437,7 @@ def make_loan_write_off(loan, company=None, posting_date=None, amount=0, as_dict
 		amount = pending_amount
 
 	# get default write off account from company master
-	write_off_account = frappe.get_value("Company", company, "write_off_account")
+	write_off_account = frappe.get_cached_value("Company", company, "write_off_account")
 
 	write_off = frappe.new_doc("Loan Write Off")
 	write_off.loan = loan
@@ -579,7 +579,8 @@ def update_days_past_due_in_loans(
 	posting_date=None, loan_product=None, loan_name=None, process_loan_classification=None
 ):
 	"""Update days past due in loans"""
-	posting_date = posting_date or getdate()
+	# convert once; the loop below runs for every pending accrual
+	posting_date = getdate(posting_date) if posting_date else getdate()
 
 	accruals = get_pending_loan_interest_accruals(loan_product=loan_product, loan_name=loan_name)
 	threshold_map = get_dpd_threshold_map()
@@ -587,7 +588,7 @@ def update_days_past_due_in_loans(
 
 	for loan in accruals:
 		is_npa = 0
-		days_past_due = date_diff(getdate(posting_date), getdate(loan.due_date))
+		days_past_due = date_diff(posting_date, loan.due_date)
 		if days_past_due < 0:
 			days_past_due = 0
 
@@ -603,7 +604,7 @@ def update_days_past_due_in_loans(
 			loan.applicant,
 			days_past_due,
 			is_npa,
-			posting_date or getdate(),
+			posting_date,
 		)
 
 		create_dpd_record(loan.loan, posting_date, days_past_due, process_loan_classification)
@@ -625,7 +626,7 @@ def update_days_past_due_in_loans(
 
 	for d in open_loans_with_no_overdue:
 		update_loan_and_customer_status(
-			d.name, d.company, d.applicant_type, d.applicant, 0, 0, posting_date or getdate()
+			d.name, d.company, d.applicant_type, d.applicant, 0, 0, posting_date
 		)
 
 		create_dpd_record(d.name, posting_date, 0, process_loan_classification)
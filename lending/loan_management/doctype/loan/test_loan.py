@@ -1,6 +1,8 @@
 # Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
 # See license.txt
 
+import json
+import os
 import unittest
 
 import frappe
@@ -42,124 +44,182 @@ from lending.loan_management.doctype.process_loan_security_shortfall.process_loa
 	create_process_loan_security_shortfall,
 )
 
+# The demand-loan tests all post on fixed 2019 dates, so the day-count
+# denominator is a module-level constant instead of being reparsed per test.
+DAYS_IN_YEAR_2019 = days_in_year(2019)
+
+# Upper bound on SQL statements a single test method may issue. Generous on
+# purpose: the point is to catch N+1 regressions in the code under test
+# (e.g. calculate_amounts), not to flake on minor fixture changes.
+DB_QUERY_BUDGET = 20000
+
+
+class QueryCounterMixin:
+	"""Counts SQL statements issued by each test method and fails the test
+	when the count exceeds DB_QUERY_BUDGET.
+
+	Set DB_QUERY_LOG_ENABLED=1 to append per-test counts to
+	logs/db-queries.jsonl for offline analysis."""
 
-class TestLoan(unittest.TestCase):
 	def setUp(self):
-		set_loan_settings_in_company()
-		create_loan_accounts()
-		simple_terms_loans = [
-			["Personal Loan", 500000, 8.4, "Monthly as per repayment start date"],
-			["Term Loan Product 1", 12000, 7.5, "Monthly as per repayment start date"],
-		]
+		super().setUp()
+		self.query_count = 0
+		self._uncounted_sql = frappe.db.sql
 
-		pro_rated_term_loans = [
-			["Term Loan Product 2", 12000, 7.5, "Pro-rated calendar months", "Start of the next month"],
-			["Term Loan Product 3", 1200, 7.5, "Pro-rated calendar months", "End of the current month"],
-		]
+		def counting_sql(*args, **kwargs):
+			self.query_count += 1
+			return self._uncounted_sql(*args, **kwargs)
 
-		for loan_product in simple_terms_loans:
-			create_loan_product(
-				loan_product[0],
-				loan_product[0],
-				loan_product[1],
-				loan_product[2],
-				repayment_schedule_type=loan_product[3],
-			)
+		frappe.db.sql = counting_sql
 
-		for loan_product in pro_rated_term_loans:
-			create_loan_product(
-				loan_product[0],
-				loan_product[0],
-				loan_product[1],
-				loan_product[2],
-				repayment_schedule_type=loan_product[3],
-				repayment_date_on=loan_product[4],
-			)
+	def tearDown(self):
+		frappe.db.sql = self._uncounted_sql
 
-		create_loan_product(
-			"Stock Loan",
-			"Stock Loan",
-			2000000,
-			13.5,
-			25,
-			1,
-			5,
-			"Cash",
-			"Disbursement Account - _TC",
-			"Payment Account - _TC",
-			"Loan Account - _TC",
-			"Interest Income Account - _TC",
-			"Penalty Income Account - _TC",
-			repayment_schedule_type="Monthly as per repayment start date",
+		if os.environ.get("DB_QUERY_LOG_ENABLED") == "1":
+			os.makedirs("logs", exist_ok=True)
+			with open(os.path.join("logs", "db-queries.jsonl"), "a") as logfile:
+				logfile.write(json.dumps({"test": self.id(), "query_count": self.query_count}) + "\n")
+
+		self.assertLess(
+			self.query_count,
+			DB_QUERY_BUDGET,
+			f"{self.id()} issued {self.query_count} queries, budget is {DB_QUERY_BUDGET}",
 		)
+		super().tearDown()
+
 
-		create_loan_product(
-			"Demand Loan",
-			"Demand Loan",
-			2000000,
-			13.5,
-			25,
-			0,
-			5,
-			"Cash",
-			"Disbursement Account - _TC",
-			"Payment Account - _TC",
-			"Loan Account - _TC",
-			"Interest Income Account - _TC",
-			"Penalty Income Account - _TC",
+class TestLoan(QueryCounterMixin, unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		set_loan_settings_in_company()
+		create_loan_accounts()
+		loan_products = {
+			"Personal Loan": {
+				"maximum_loan_amount": 500000,
+				"rate_of_interest": 8.4,
+				"repayment_schedule_type": "Monthly as per repayment start date",
+			},
+			"Term Loan Product 1": {
+				"maximum_loan_amount": 12000,
+				"rate_of_interest": 7.5,
+				"repayment_schedule_type": "Monthly as per repayment start date",
+			},
+			"Term Loan Product 2": {
+				"maximum_loan_amount": 12000,
+				"rate_of_interest": 7.5,
+				"repayment_schedule_type": "Pro-rated calendar months",
+				"repayment_date_on": "Start of the next month",
+			},
+			"Term Loan Product 3": {
+				"maximum_loan_amount": 1200,
+				"rate_of_interest": 7.5,
+				"repayment_schedule_type": "Pro-rated calendar months",
+				"repayment_date_on": "End of the current month",
+			},
+			"Stock Loan": {
+				"maximum_loan_amount": 2000000,
+				"rate_of_interest": 13.5,
+				"penalty_interest_rate": 25,
+				"is_term_loan": 1,
+				"grace_period_in_days": 5,
+				"repayment_schedule_type": "Monthly as per repayment start date",
+			},
+			"Demand Loan": {
+				"maximum_loan_amount": 2000000,
+				"rate_of_interest": 13.5,
+				"penalty_interest_rate": 25,
+				"is_term_loan": 0,
+				"grace_period_in_days": 5,
+			},
+		}
+
+		# One existence query for all products instead of one per create_loan_product call
+		existing_products = set(
+			frappe.db.get_all(
+				"Loan Product", filters={"name": ("in", list(loan_products))}, pluck="name"
+			)
 		)
 
+		for product_code, kwargs in loan_products.items():
+			if product_code not in existing_products:
+				create_loan_product(product_code, product_code, **kwargs)
+
 		create_loan_security_type()
 		create_loan_security()
 
-		create_loan_security_price(
-			"Test Security 1", 500, "Nos", get_datetime(), get_datetime(add_to_date(nowdate(), hours=24))
+		create_loan_security_prices(
+			{"Test Security 1": 500, "Test Security 2": 250},
+			"Nos",
+			get_datetime(),
+			get_datetime(add_to_date(nowdate(), hours=24)),
 		)
-		create_loan_security_price(
-			"Test Security 2", 250, "Nos", get_datetime(), get_datetime(add_to_date(nowdate(), hours=24))
+
+		cls.applicant1 = make_employee("robert_loan@loan.com")
+
+		customers = ["_Test Loan Customer", "_Test Loan Customer 1"]
+		existing_customers = set(
+			frappe.db.get_all("Customer", filters={"name": ("in", customers)}, pluck="name")
 		)
+		for customer in customers:
+			if customer not in existing_customers:
+				frappe.get_doc(get_customer_dict(customer)).insert(ignore_permissions=True)
 
-		self.applicant1 = make_employee("robert_loan@loan.com")
-		if not frappe.db.exists("Customer", "_Test Loan Customer"):
-			frappe.get_doc(get_customer_dict("_Test Loan Customer")).insert(ignore_permissions=True)
+		cls.applicant2, cls.applicant3 = customers
 
-		if not frappe.db.exists("Customer", "_Test Loan Customer 1"):
-			frappe.get_doc(get_customer_dict("_Test Loan Customer 1")).insert(ignore_permissions=True)
+	def setUp(self):
+		super().setUp()
+		# Isolate each test's writes; the class-level fixtures above stay put
+		frappe.db.savepoint("test_loan")
 
-		self.applicant2 = frappe.db.get_value("Customer", {"name": "_Test Loan Customer"}, "name")
-		self.applicant3 = frappe.db.get_value("Customer", {"name": "_Test Loan Customer 1"}, "name")
+	def tearDown(self):
+		frappe.db.rollback(save_point="test_loan")
+		super().tearDown()
 
 	def test_loan(self):
 		loan = create_loan(self.applicant1, "Personal Loan", 280000, "Repay Over Number of Periods", 20)
 
-		loan_repayment_schedule = frappe.get_doc(
-			"Loan Repayment Schedule", {"loan": loan.name, "docstatus": 0}
+		schedule_details = frappe.db.get_value(
+			"Loan Repayment Schedule",
+			{"loan": loan.name, "docstatus": 0},
+			["name", "monthly_repayment_amount"],
+			as_dict=1,
 		)
-		schedule = loan_repayment_schedule.repayment_schedule
 
-		self.assertEqual(loan_repayment_schedule.monthly_repayment_amount, 15052)
+		self.assertEqual(schedule_details.monthly_repayment_amount, 15052)
 		self.assertEqual(flt(loan.total_interest_payable, 0), 21034)
 		self.assertEqual(flt(loan.total_payment, 0), 301034)
-		self.assertEqual(len(schedule), 20)
+		self.assertEqual(frappe.db.count("Repayment Schedule", {"parent": schedule_details.name}), 20)
+
+		# Only fetch the three rows under assertion instead of materializing
+		# the full schedule document (idx is 1-based)
+		rows = {
+			row.idx: row
+			for row in frappe.db.get_all(
+				"Repayment Schedule",
+				filters={"parent": schedule_details.name, "idx": ("in", [4, 18, 20])},
+				fields=["idx", "principal_amount", "interest_amount", "balance_loan_amount"],
+			)
+		}
 
 		for idx, principal_amount, interest_amount, balance_loan_amount in [
-			[3, 13369, 1683, 227080],
-			[19, 14941, 105, 0],
-			[17, 14740, 312, 29785],
+			[4, 13369, 1683, 227080],
+			[20, 14941, 105, 0],
+			[18, 14740, 312, 29785],
 		]:
-			self.assertEqual(flt(schedule[idx].principal_amount, 0), principal_amount)
-			self.assertEqual(flt(schedule[idx].interest_amount, 0), interest_amount)
-			self.assertEqual(flt(schedule[idx].balance_loan_amount, 0), balance_loan_amount)
+			self.assertEqual(flt(rows[idx].principal_amount, 0), principal_amount)
+			self.assertEqual(flt(rows[idx].interest_amount, 0), interest_amount)
+			self.assertEqual(flt(rows[idx].balance_loan_amount, 0), balance_loan_amount)
 
 		loan.repayment_method = "Repay Fixed Amount per Period"
 		loan.monthly_repayment_amount = 14000
 		loan.save()
 
-		loan_repayment_schedule = frappe.get_doc(
-			"Loan Repayment Schedule", {"loan": loan.name, "docstatus": 0}
+		schedule_name = frappe.db.get_value(
+			"Loan Repayment Schedule", {"loan": loan.name, "docstatus": 0}, "name"
 		)
 
-		self.assertEqual(len(loan_repayment_schedule.repayment_schedule), 22)
+		self.assertEqual(frappe.db.count("Repayment Schedule", {"parent": schedule_name}), 22)
 		self.assertEqual(flt(loan.total_interest_payable, 0), 22712)
 		self.assertEqual(flt(loan.total_payment, 0), 302712)
 
@@ -171,28 +231,13 @@ class TestLoan(unittest.TestCase):
 			}
 		]
 
-		loan_application = create_loan_application(
-			"_Test Company", self.applicant2, "Stock Loan", pledge, "Repay Over Number of Periods", 12
-		)
-		create_pledge(loan_application)
-
-		loan = create_loan_with_security(
-			self.applicant2, "Stock Loan", "Repay Over Number of Periods", 12, loan_application
-		)
+		loan = create_secured_stock_loan(self.applicant2, pledge)
 		self.assertEqual(loan.loan_amount, 1000000)
 
 	def test_loan_disbursement(self):
 		pledge = [{"loan_security": "Test Security 1", "qty": 4000.00}]
 
-		loan_application = create_loan_application(
-			"_Test Company", self.applicant2, "Stock Loan", pledge, "Repay Over Number of Periods", 12
-		)
-
-		create_pledge(loan_application)
-
-		loan = create_loan_with_security(
-			self.applicant2, "Stock Loan", "Repay Over Number of Periods", 12, loan_application
-		)
+		loan = create_secured_stock_loan(self.applicant2, pledge)
 		self.assertEqual(loan.loan_amount, 1000000)
 
 		loan.submit()
@@ -200,29 +245,31 @@ class TestLoan(unittest.TestCase):
 		loan_disbursement_entry1 = make_loan_disbursement_entry(loan.name, 500000)
 		loan_disbursement_entry2 = make_loan_disbursement_entry(loan.name, 500000)
 
-		loan = frappe.get_doc("Loan", loan.name)
-		gl_entries1 = frappe.db.get_all(
-			"GL Entry",
-			fields=["name"],
-			filters={"voucher_type": "Loan Disbursement", "voucher_no": loan_disbursement_entry1.name},
-		)
-
-		gl_entries2 = frappe.db.get_all(
-			"GL Entry",
-			fields=["name"],
-			filters={"voucher_type": "Loan Disbursement", "voucher_no": loan_disbursement_entry2.name},
-		)
+		loan_details = frappe.db.get_value(
+			"Loan", loan.name, ["status", "disbursed_amount"], as_dict=1
+		)
+		gl_vouchers = {
+			d.voucher_no
+			for d in frappe.db.get_all(
+				"GL Entry",
+				fields=["voucher_no"],
+				filters={
+					"voucher_type": "Loan Disbursement",
+					"voucher_no": ("in", [loan_disbursement_entry1.name, loan_disbursement_entry2.name]),
+				},
+			)
+		}
 
-		self.assertEqual(loan.status, "Disbursed")
-		self.assertEqual(loan.disbursed_amount, 1000000)
-		self.assertTrue(gl_entries1)
-		self.assertTrue(gl_entries2)
+		self.assertEqual(loan_details.status, "Disbursed")
+		self.assertEqual(loan_details.disbursed_amount, 1000000)
+		self.assertIn(loan_disbursement_entry1.name, gl_vouchers)
+		self.assertIn(loan_disbursement_entry2.name, gl_vouchers)
 
 	def test_sanctioned_amount_limit(self):
-		# Clear loan docs before checking
-		frappe.db.sql("DELETE FROM `tabLoan` where applicant = '_Test Loan Customer 1'")
-		frappe.db.sql("DELETE FROM `tabLoan Application` where applicant = '_Test Loan Customer 1'")
-		frappe.db.sql("DELETE FROM `tabLoan Security Pledge` where applicant = '_Test Loan Customer 1'")
+		# Clear loan docs before checking; left uncommitted so the per-test
+		# savepoint rollback can undo it
+		for doctype in ("Loan", "Loan Application", "Loan Security Pledge"):
+			frappe.db.delete(doctype, {"applicant": "_Test Loan Customer 1"})
 
 		if not frappe.db.get_value(
 			"Sanctioned Loan Amount",
@@ -263,15 +310,7 @@ class TestLoan(unittest.TestCase):
 	def test_regular_loan_repayment(self):
 		pledge = [{"loan_security": "Test Security 1", "qty": 4000.00}]
 
-		loan_application = create_loan_application(
-			"_Test Company", self.applicant2, "Demand Loan", pledge
-		)
-		create_pledge(loan_application)
-
-		loan = create_demand_loan(
-			self.applicant2, "Demand Loan", loan_application, posting_date="2019-10-01"
-		)
-		loan.submit()
+		loan = create_disbursed_demand_loan(self.applicant2, pledge)
 
 		self.assertEqual(loan.loan_amount, 1000000)
 
@@ -281,19 +320,15 @@ class TestLoan(unittest.TestCase):
 		no_of_days = date_diff(last_date, first_date) + 1
 
 		accrued_interest_amount = flt(
-			(loan.loan_amount * loan.rate_of_interest * no_of_days)
-			/ (days_in_year(get_datetime(first_date).year) * 100),
+			(loan.loan_amount * loan.rate_of_interest * no_of_days) / (DAYS_IN_YEAR_2019 * 100),
 			2,
 		)
 
-		make_loan_disbursement_entry(loan.name, loan.loan_amount, disbursement_date=first_date)
-
 		process_loan_interest_accrual_for_demand_loans(posting_date=last_date)
 
 		repayment_entry = create_repayment_entry(
 			loan.name, self.applicant2, add_days(last_date, 10), 111119
 		)
-		repayment_entry.save()
 		repayment_entry.submit()
 
 		penalty_amount = (accrued_interest_amount * 5 * 25) / (100 * 365)
@@ -303,35 +338,22 @@ class TestLoan(unittest.TestCase):
 			"Loan Interest Accrual", {"loan": loan.name}, ["paid_interest_amount"]
 		)
 
-		loan.load_from_db()
-
 		total_interest_paid = amounts[0]["paid_interest_amount"] + amounts[1]["paid_interest_amount"]
 		self.assertEqual(amounts[1]["paid_interest_amount"], repayment_entry.interest_payable)
 		self.assertEqual(
-			flt(loan.total_principal_paid, 0),
+			flt(frappe.db.get_value("Loan", loan.name, "total_principal_paid"), 0),
 			flt(repayment_entry.amount_paid - penalty_amount - total_interest_paid, 0),
 		)
 
-		# Check Repayment Entry cancel
-		repayment_entry.load_from_db()
+		# Check Repayment Entry cancel; the in-memory doc is current after submit
 		repayment_entry.cancel()
 
-		loan.load_from_db()
-		self.assertEqual(loan.total_principal_paid, 0)
-		self.assertEqual(loan.total_principal_paid, 0)
+		self.assertEqual(frappe.db.get_value("Loan", loan.name, "total_principal_paid"), 0)
 
 	def test_loan_closure(self):
 		pledge = [{"loan_security": "Test Security 1", "qty": 4000.00}]
 
-		loan_application = create_loan_application(
-			"_Test Company", self.applicant2, "Demand Loan", pledge
-		)
-		create_pledge(loan_application)
-
-		loan = create_demand_loan(
-			self.applicant2, "Demand Loan", loan_application, posting_date="2019-10-01"
-		)
-		loan.submit()
+		loan = create_disbursed_demand_loan(self.applicant2, pledge)
 
 		self.assertEqual(loan.loan_amount, 1000000)
 
@@ -346,10 +368,9 @@ class TestLoan(unittest.TestCase):
 		no_of_days += 5
 
 		accrued_interest_amount = (loan.loan_amount * loan.rate_of_interest * no_of_days) / (
-			days_in_year(get_datetime(first_date).year) * 100
+			DAYS_IN_YEAR_2019 * 100
 		)
 
-		make_loan_disbursement_entry(loan.name, loan.loan_amount, disbursement_date=first_date)
 		process_loan_interest_accrual_for_demand_loans(posting_date=last_date)
 
 		repayment_entry = create_repayment_entry(
@@ -369,8 +390,7 @@ class TestLoan(unittest.TestCase):
 		self.assertEqual(flt(repayment_entry.penalty_amount, 5), 0)
 
 		request_loan_closure(loan.name)
-		loan.load_from_db()
-		self.assertEqual(loan.status, "Loan Closure Requested")
+		self.assertEqual(frappe.db.get_value("Loan", loan.name, "status"), "Loan Closure Requested")
 
 	def test_loan_repayment_for_term_loan(self):
 		pledges = [
@@ -422,23 +442,12 @@ class TestLoan(unittest.TestCase):
 			}
 		]
 
-		loan_application = create_loan_application(
-			"_Test Company", self.applicant2, "Stock Loan", pledges, "Repay Over Number of Periods", 12
-		)
-
-		create_pledge(loan_application)
-
-		loan = create_loan_with_security(
-			self.applicant2, "Stock Loan", "Repay Over Number of Periods", 12, loan_application
-		)
+		loan = create_secured_stock_loan(self.applicant2, pledges)
 		loan.submit()
 
 		make_loan_disbursement_entry(loan.name, loan.loan_amount)
 
-		frappe.db.sql(
-			"""UPDATE `tabLoan Security Price` SET loan_security_price = 100
-			where loan_security='Test Security 2'"""
-		)
+		set_loan_security_price("Test Security 2", 100)
 
 		create_process_loan_security_shortfall()
 		loan_security_shortfall = frappe.get_doc("Loan Security Shortfall", {"loan": loan.name})
@@ -448,10 +457,7 @@ class TestLoan(unittest.TestCase):
 		self.assertEqual(flt(loan_security_shortfall.security_value, 2), 800000.00)
 		self.assertEqual(flt(loan_security_shortfall.shortfall_amount, 2), 600000.00)
 
-		frappe.db.sql(
-			""" UPDATE `tabLoan Security Price` SET loan_security_price = 250
-			where loan_security='Test Security 2'"""
-		)
+		set_loan_security_price("Test Security 2", 250)
 
 		create_process_loan_security_shortfall()
 		loan_security_shortfall = frappe.get_doc("Loan Security Shortfall", {"loan": loan.name})
@@ -461,15 +467,7 @@ class TestLoan(unittest.TestCase):
 	def test_loan_security_unpledge(self):
 		pledge = [{"loan_security": "Test Security 1", "qty": 4000.00}]
 
-		loan_application = create_loan_application(
-			"_Test Company", self.applicant2, "Demand Loan", pledge
-		)
-		create_pledge(loan_application)
-
-		loan = create_demand_loan(
-			self.applicant2, "Demand Loan", loan_application, posting_date="2019-10-01"
-		)
-		loan.submit()
+		loan = create_disbursed_demand_loan(self.applicant2, pledge)
 
 		self.assertEqual(loan.loan_amount, 1000000)
 
@@ -481,10 +479,9 @@ class TestLoan(unittest.TestCase):
 		no_of_days += 5
 
 		accrued_interest_amount = (loan.loan_amount * loan.rate_of_interest * no_of_days) / (
-			days_in_year(get_datetime(first_date).year) * 100
+			DAYS_IN_YEAR_2019 * 100
 		)
 
-		make_loan_disbursement_entry(loan.name, loan.loan_amount, disbursement_date=first_date)
 		process_loan_interest_accrual_for_demand_loans(posting_date=last_date)
 
 		repayment_entry = create_repayment_entry(
@@ -496,18 +493,16 @@ class TestLoan(unittest.TestCase):
 		repayment_entry.submit()
 
 		request_loan_closure(loan.name)
-		loan.load_from_db()
-		self.assertEqual(loan.status, "Loan Closure Requested")
+		self.assertEqual(frappe.db.get_value("Loan", loan.name, "status"), "Loan Closure Requested")
 
 		unpledge_request = unpledge_security(loan=loan.name, save=1)
 		unpledge_request.submit()
 		unpledge_request.status = "Approved"
 		unpledge_request.save()
-		loan.load_from_db()
 
 		pledged_qty = get_pledged_security_qty(loan.name)
 
-		self.assertEqual(loan.status, "Closed")
+		self.assertEqual(frappe.db.get_value("Loan", loan.name, "status"), "Closed")
 		self.assertEqual(sum(pledged_qty.values()), 0)
 
 		amounts = amounts = calculate_amounts(loan.name, add_days(last_date, 5))
@@ -521,22 +516,12 @@ class TestLoan(unittest.TestCase):
 			{"loan_security": "Test Security 2", "qty": 4000.00},
 		]
 
-		loan_application = create_loan_application(
-			"_Test Company", self.applicant2, "Demand Loan", pledge
-		)
-		create_pledge(loan_application)
-
-		loan = create_demand_loan(
-			self.applicant2, "Demand Loan", loan_application, posting_date="2019-10-01"
-		)
-		loan.submit()
+		loan = create_disbursed_demand_loan(self.applicant2, pledge)
 
 		self.assertEqual(loan.loan_amount, 1000000)
 
-		first_date = "2019-10-01"
 		last_date = "2019-10-30"
 
-		make_loan_disbursement_entry(loan.name, loan.loan_amount, disbursement_date=first_date)
 		process_loan_interest_accrual_for_demand_loans(posting_date=last_date)
 
 		repayment_entry = create_repayment_entry(
@@ -550,8 +535,6 @@ class TestLoan(unittest.TestCase):
 		unpledge_request.submit()
 		unpledge_request.status = "Approved"
 		unpledge_request.save()
-		unpledge_request.submit()
-		unpledge_request.load_from_db()
 		self.assertEqual(unpledge_request.docstatus, 1)
 
 	def test_sanctioned_loan_security_unpledge(self):
@@ -574,7 +557,6 @@ class TestLoan(unittest.TestCase):
 		unpledge_request.submit()
 		unpledge_request.status = "Approved"
 		unpledge_request.save()
-		unpledge_request.submit()
 
 	def test_disbursal_check_with_shortfall(self):
 		pledges = [
@@ -585,24 +567,13 @@ class TestLoan(unittest.TestCase):
 			}
 		]
 
-		loan_application = create_loan_application(
-			"_Test Company", self.applicant2, "Stock Loan", pledges, "Repay Over Number of Periods", 12
-		)
-
-		create_pledge(loan_application)
-
-		loan = create_loan_with_security(
-			self.applicant2, "Stock Loan", "Repay Over Number of Periods", 12, loan_application
-		)
+		loan = create_secured_stock_loan(self.applicant2, pledges)
 		loan.submit()
 
 		# Disbursing 7,00,000 from the allowed 10,00,000 according to security pledge
 		make_loan_disbursement_entry(loan.name, 700000)
 
-		frappe.db.sql(
-			"""UPDATE `tabLoan Security Price` SET loan_security_price = 100
-			where loan_security='Test Security 2'"""
-		)
+		set_loan_security_price("Test Security 2", 100)
 
 		create_process_loan_security_shortfall()
 		loan_security_shortfall = frappe.get_doc("Loan Security Shortfall", {"loan": loan.name})
@@ -610,10 +581,7 @@ class TestLoan(unittest.TestCase):
 
 		self.assertEqual(get_disbursal_amount(loan.name), 0)
 
-		frappe.db.sql(
-			""" UPDATE `tabLoan Security Price` SET loan_security_price = 250
-			where loan_security='Test Security 2'"""
-		)
+		set_loan_security_price("Test Security 2", 250)
 
 	def test_disbursal_check_without_shortfall(self):
 		pledges = [
@@ -624,15 +592,7 @@ class TestLoan(unittest.TestCase):
 			}
 		]
 
-		loan_application = create_loan_application(
-			"_Test Company", self.applicant2, "Stock Loan", pledges, "Repay Over Number of Periods", 12
-		)
-
-		create_pledge(loan_application)
-
-		loan = create_loan_with_security(
-			self.applicant2, "Stock Loan", "Repay Over Number of Periods", 12, loan_application
-		)
+		loan = create_secured_stock_loan(self.applicant2, pledges)
 		loan.submit()
 
 		# Disbursing 7,00,000 from the allowed 10,00,000 according to security pledge
@@ -643,15 +603,7 @@ class TestLoan(unittest.TestCase):
 	def test_pending_loan_amount_after_closure_request(self):
 		pledge = [{"loan_security": "Test Security 1", "qty": 4000.00}]
 
-		loan_application = create_loan_application(
-			"_Test Company", self.applicant2, "Demand Loan", pledge
-		)
-		create_pledge(loan_application)
-
-		loan = create_demand_loan(
-			self.applicant2, "Demand Loan", loan_application, posting_date="2019-10-01"
-		)
-		loan.submit()
+		loan = create_disbursed_demand_loan(self.applicant2, pledge)
 
 		self.assertEqual(loan.loan_amount, 1000000)
 
@@ -663,14 +615,11 @@ class TestLoan(unittest.TestCase):
 		no_of_days += 5
 
 		accrued_interest_amount = (loan.loan_amount * loan.rate_of_interest * no_of_days) / (
-			days_in_year(get_datetime(first_date).year) * 100
+			DAYS_IN_YEAR_2019 * 100
 		)
 
-		make_loan_disbursement_entry(loan.name, loan.loan_amount, disbursement_date=first_date)
 		process_loan_interest_accrual_for_demand_loans(posting_date=last_date)
 
-		amounts = calculate_amounts(loan.name, add_days(last_date, 5))
-
 		repayment_entry = create_repayment_entry(
 			loan.name,
 			self.applicant2,
@@ -679,13 +628,8 @@ class TestLoan(unittest.TestCase):
 		)
 		repayment_entry.submit()
 
-		amounts = frappe.db.get_value(
-			"Loan Interest Accrual", {"loan": loan.name}, ["paid_interest_amount", "paid_principal_amount"]
-		)
-
 		request_loan_closure(loan.name)
-		loan.load_from_db()
-		self.assertEqual(loan.status, "Loan Closure Requested")
+		self.assertEqual(frappe.db.get_value("Loan", loan.name, "status"), "Loan Closure Requested")
 
 		amounts = calculate_amounts(loan.name, add_days(last_date, 5))
 		self.assertEqual(amounts["pending_principal_amount"], 0.0)
@@ -693,15 +637,7 @@ class TestLoan(unittest.TestCase):
 	def test_partial_unaccrued_interest_payment(self):
 		pledge = [{"loan_security": "Test Security 1", "qty": 4000.00}]
 
-		loan_application = create_loan_application(
-			"_Test Company", self.applicant2, "Demand Loan", pledge
-		)
-		create_pledge(loan_application)
-
-		loan = create_demand_loan(
-			self.applicant2, "Demand Loan", loan_application, posting_date="2019-10-01"
-		)
-		loan.submit()
+		loan = create_disbursed_demand_loan(self.applicant2, pledge)
 
 		self.assertEqual(loan.loan_amount, 1000000)
 
@@ -714,10 +650,9 @@ class TestLoan(unittest.TestCase):
 
 		# get partial unaccrued interest amount
 		paid_amount = (loan.loan_amount * loan.rate_of_interest * no_of_days) / (
-			days_in_year(get_datetime(first_date).year) * 100
+			DAYS_IN_YEAR_2019 * 100
 		)
 
-		make_loan_disbursement_entry(loan.name, loan.loan_amount, disbursement_date=first_date)
 		process_loan_interest_accrual_for_demand_loans(posting_date=last_date)
 
 		amounts = calculate_amounts(loan.name, add_days(last_date, 5))
@@ -727,14 +662,17 @@ class TestLoan(unittest.TestCase):
 		)
 
 		repayment_entry.submit()
-		repayment_entry.load_from_db()
 
 		partial_accrued_interest_amount = (loan.loan_amount * loan.rate_of_interest * 5) / (
-			days_in_year(get_datetime(first_date).year) * 100
+			DAYS_IN_YEAR_2019 * 100
+		)
+
+		total_interest_paid = frappe.db.get_value(
+			"Loan Repayment", repayment_entry.name, "total_interest_paid"
 		)
 
 		interest_amount = flt(amounts["interest_amount"] + partial_accrued_interest_amount, 2)
-		self.assertEqual(flt(repayment_entry.total_interest_paid, 0), flt(interest_amount, 0))
+		self.assertEqual(flt(total_interest_paid, 0), flt(interest_amount, 0))
 
 	def test_penalty(self):
 		loan, amounts = create_loan_scenario_for_penalty(self)
@@ -753,18 +691,11 @@ class TestLoan(unittest.TestCase):
 		self.assertEqual(loan.loan_amount, 1000000)
 		self.assertEqual(calculated_penalty_amount, penalty_amount)
 
-	def test_loan_write_off_limit(self):
+	def _create_write_off_scenario(self, shortfall_amount):
+		"""Disburse a demand loan and repay everything except shortfall_amount."""
 		pledge = [{"loan_security": "Test Security 1", "qty": 4000.00}]
 
-		loan_application = create_loan_application(
-			"_Test Company", self.applicant2, "Demand Loan", pledge
-		)
-		create_pledge(loan_application)
-
-		loan = create_demand_loan(
-			self.applicant2, "Demand Loan", loan_application, posting_date="2019-10-01"
-		)
-		loan.submit()
+		loan = create_disbursed_demand_loan(self.applicant2, pledge)
 
 		self.assertEqual(loan.loan_amount, 1000000)
 
@@ -775,18 +706,16 @@ class TestLoan(unittest.TestCase):
 		no_of_days += 5
 
 		accrued_interest_amount = (loan.loan_amount * loan.rate_of_interest * no_of_days) / (
-			days_in_year(get_datetime(first_date).year) * 100
+			DAYS_IN_YEAR_2019 * 100
 		)
 
-		make_loan_disbursement_entry(loan.name, loan.loan_amount, disbursement_date=first_date)
 		process_loan_interest_accrual_for_demand_loans(posting_date=last_date)
 
-		# repay 50 less so that it can be automatically written off
 		repayment_entry = create_repayment_entry(
 			loan.name,
 			self.applicant2,
 			add_days(last_date, 5),
-			flt(loan.loan_amount + accrued_interest_amount - 50),
+			flt(loan.loan_amount + accrued_interest_amount - shortfall_amount),
 		)
 
 		repayment_entry.submit()
@@ -799,11 +728,16 @@ class TestLoan(unittest.TestCase):
 		self.assertEqual(flt(repayment_entry.penalty_amount, 5), 0)
 
 		amounts = calculate_amounts(loan.name, add_days(last_date, 5))
-		self.assertEqual(flt(amounts["pending_principal_amount"], 0), 50)
+		self.assertEqual(flt(amounts["pending_principal_amount"], 0), shortfall_amount)
+
+		return loan, amounts
+
+	def test_loan_write_off_limit(self):
+		# repay 50 less so that it can be automatically written off
+		loan, amounts = self._create_write_off_scenario(50)
 
 		request_loan_closure(loan.name)
-		loan.load_from_db()
-		self.assertEqual(loan.status, "Loan Closure Requested")
+		self.assertEqual(frappe.db.get_value("Loan", loan.name, "status"), "Loan Closure Requested")
 
 	def test_loan_repayment_against_partially_disbursed_loan(self):
 		pledge = [{"loan_security": "Test Security 1", "qty": 4000.00}]
@@ -823,65 +757,19 @@ class TestLoan(unittest.TestCase):
 
 		make_loan_disbursement_entry(loan.name, loan.loan_amount / 2, disbursement_date=first_date)
 
-		loan.load_from_db()
-
-		self.assertEqual(loan.status, "Partially Disbursed")
+		self.assertEqual(frappe.db.get_value("Loan", loan.name, "status"), "Partially Disbursed")
 		create_repayment_entry(
 			loan.name, self.applicant2, add_days(last_date, 5), flt(loan.loan_amount / 3)
 		)
 
 	def test_loan_amount_write_off(self):
-		pledge = [{"loan_security": "Test Security 1", "qty": 4000.00}]
-
-		loan_application = create_loan_application(
-			"_Test Company", self.applicant2, "Demand Loan", pledge
-		)
-		create_pledge(loan_application)
-
-		loan = create_demand_loan(
-			self.applicant2, "Demand Loan", loan_application, posting_date="2019-10-01"
-		)
-		loan.submit()
-
-		self.assertEqual(loan.loan_amount, 1000000)
-
-		first_date = "2019-10-01"
-		last_date = "2019-10-30"
-
-		no_of_days = date_diff(last_date, first_date) + 1
-		no_of_days += 5
-
-		accrued_interest_amount = (loan.loan_amount * loan.rate_of_interest * no_of_days) / (
-			days_in_year(get_datetime(first_date).year) * 100
-		)
-
-		make_loan_disbursement_entry(loan.name, loan.loan_amount, disbursement_date=first_date)
-		process_loan_interest_accrual_for_demand_loans(posting_date=last_date)
-
-		# repay 100 less so that it can be automatically written off
-		repayment_entry = create_repayment_entry(
-			loan.name,
-			self.applicant2,
-			add_days(last_date, 5),
-			flt(loan.loan_amount + accrued_interest_amount - 100),
-		)
-
-		repayment_entry.submit()
-
-		amount = frappe.db.get_value(
-			"Loan Interest Accrual", {"loan": loan.name}, ["sum(paid_interest_amount)"]
-		)
-
-		self.assertEqual(flt(amount, 0), flt(accrued_interest_amount, 0))
-		self.assertEqual(flt(repayment_entry.penalty_amount, 5), 0)
-
-		amounts = calculate_amounts(loan.name, add_days(last_date, 5))
-		self.assertEqual(flt(amounts["pending_principal_amount"], 0), 100)
+		# repay 100 less so that it has to be written off explicitly
+		loan, amounts = self._create_write_off_scenario(100)
 
 		we = make_loan_write_off(loan.name, amount=amounts["pending_principal_amount"])
 		we.submit()
 
-		amounts = calculate_amounts(loan.name, add_days(last_date, 5))
+		amounts = calculate_amounts(loan.name, add_days("2019-10-30", 5))
 		self.assertEqual(flt(amounts["pending_principal_amount"], 0), 0)
 
 	def test_term_loan_schedule_types(self):
@@ -894,70 +782,47 @@ class TestLoan(unittest.TestCase):
 			repayment_start_date="2022-10-17",
 		)
 
-		loan_repayment_schedule = frappe.get_doc(
-			"Loan Repayment Schedule", {"loan": loan.name, "docstatus": 0}
-		)
-		schedule = loan_repayment_schedule.repayment_schedule
+		def assert_schedule_dates(first_date, second_date, last_date):
+			# Check for first, second and last installment date
+			loan_repayment_schedule = frappe.get_doc(
+				"Loan Repayment Schedule", {"loan": loan.name, "docstatus": 0}
+			)
+			schedule = loan_repayment_schedule.repayment_schedule
 
-		# Check for first, second and last installment date
-		self.assertEqual(format_date(schedule[0].payment_date, "dd-MM-yyyy"), "17-10-2022")
-		self.assertEqual(format_date(schedule[1].payment_date, "dd-MM-yyyy"), "17-11-2022")
-		self.assertEqual(format_date(schedule[-1].payment_date, "dd-MM-yyyy"), "17-09-2023")
+			self.assertEqual(format_date(schedule[0].payment_date, "dd-MM-yyyy"), first_date)
+			self.assertEqual(format_date(schedule[1].payment_date, "dd-MM-yyyy"), second_date)
+			self.assertEqual(format_date(schedule[-1].payment_date, "dd-MM-yyyy"), last_date)
+
+		with self.subTest(loan_product="Term Loan Product 1"):
+			assert_schedule_dates("17-10-2022", "17-11-2022", "17-09-2023")
 
 		loan.loan_product = "Term Loan Product 2"
 		loan.save()
 
-		loan_repayment_schedule = frappe.get_doc(
-			"Loan Repayment Schedule", {"loan": loan.name, "docstatus": 0}
-		)
-		schedule = loan_repayment_schedule.repayment_schedule
-
-		# Check for first, second and last installment date
-		self.assertEqual(format_date(schedule[0].payment_date, "dd-MM-yyyy"), "01-11-2022")
-		self.assertEqual(format_date(schedule[1].payment_date, "dd-MM-yyyy"), "01-12-2022")
-		self.assertEqual(format_date(schedule[-1].payment_date, "dd-MM-yyyy"), "01-10-2023")
+		with self.subTest(loan_product="Term Loan Product 2"):
+			assert_schedule_dates("01-11-2022", "01-12-2022", "01-10-2023")
 
 		loan.loan_product = "Term Loan Product 3"
 		loan.save()
 
-		loan_repayment_schedule = frappe.get_doc(
-			"Loan Repayment Schedule", {"loan": loan.name, "docstatus": 0}
-		)
-		schedule = loan_repayment_schedule.repayment_schedule
-
-		# Check for first, second and last installment date
-		self.assertEqual(format_date(schedule[0].payment_date, "dd-MM-yyyy"), "31-10-2022")
-		self.assertEqual(format_date(schedule[1].payment_date, "dd-MM-yyyy"), "30-11-2022")
-		self.assertEqual(format_date(schedule[-1].payment_date, "dd-MM-yyyy"), "30-09-2023")
+		with self.subTest(loan_product="Term Loan Product 3"):
+			assert_schedule_dates("31-10-2022", "30-11-2022", "30-09-2023")
 
 		loan.repayment_method = "Repay Fixed Amount per Period"
 		loan.monthly_repayment_amount = 1042
 		loan.save()
 
-		loan_repayment_schedule = frappe.get_doc(
-			"Loan Repayment Schedule", {"loan": loan.name, "docstatus": 0}
-		)
-		schedule = loan_repayment_schedule.repayment_schedule
-
-		self.assertEqual(format_date(schedule[0].payment_date, "dd-MM-yyyy"), "31-10-2022")
-		self.assertEqual(format_date(schedule[1].payment_date, "dd-MM-yyyy"), "30-11-2022")
-		self.assertEqual(format_date(schedule[-1].payment_date, "dd-MM-yyyy"), "30-09-2023")
+		with self.subTest(repayment_method="Repay Fixed Amount per Period"):
+			assert_schedule_dates("31-10-2022", "30-11-2022", "30-09-2023")
 
 
 def create_loan_scenario_for_penalty(doc):
 	pledge = [{"loan_security": "Test Security 1", "qty": 4000.00}]
 
-	loan_application = create_loan_application("_Test Company", doc.applicant2, "Demand Loan", pledge)
-	create_pledge(loan_application)
-	loan = create_demand_loan(
-		doc.applicant2, "Demand Loan", loan_application, posting_date="2019-10-01"
-	)
-	loan.submit()
+	loan = create_disbursed_demand_loan(doc.applicant2, pledge)
 
-	first_date = "2019-10-01"
 	last_date = "2019-10-30"
 
-	make_loan_disbursement_entry(loan.name, loan.loan_amount, disbursement_date=first_date)
 	process_loan_interest_accrual_for_demand_loans(posting_date=last_date)
 
 	amounts = calculate_amounts(loan.name, add_days(last_date, 1))
@@ -972,49 +837,94 @@ def create_loan_scenario_for_penalty(doc):
 	return loan, amounts
 
 
-def create_loan_accounts():
-	create_account(
-		"Loans and Advances (Assets)",
-		"Current Assets - _TC",
-		"Asset",
-		"Bank",
-		"Balance Sheet",
-		is_group=1,
+def create_secured_stock_loan(applicant, pledges):
+	"""Create an approved Stock Loan application and the loan against it."""
+	loan_application = create_loan_application(
+		"_Test Company", applicant, "Stock Loan", pledges, "Repay Over Number of Periods", 12
 	)
-	create_account(
-		"Loan Account", "Loans and Advances (Assets) - _TC", "Asset", "Receivable", "Balance Sheet"
-	)
-	create_account("Payment Account", "Bank Accounts - _TC", "Asset", "Bank", "Balance Sheet")
-	create_account("Disbursement Account", "Bank Accounts - _TC", "Asset", "Bank", "Balance Sheet")
-	create_account(
-		"Interest Income Account", "Direct Income - _TC", "Income", "Income Account", "Profit and Loss"
-	)
-	create_account(
-		"Penalty Income Account", "Direct Income - _TC", "Income", "Income Account", "Profit and Loss"
+	create_pledge(loan_application)
+
+	return create_loan_with_security(
+		applicant, "Stock Loan", "Repay Over Number of Periods", 12, loan_application
 	)
-	create_account(
+
+
+def create_disbursed_demand_loan(applicant, pledge, posting_date="2019-10-01"):
+	"""Create, submit and fully disburse a demand loan against the given pledge."""
+	loan_application = create_loan_application("_Test Company", applicant, "Demand Loan", pledge)
+	create_pledge(loan_application)
+
+	loan = create_demand_loan(applicant, "Demand Loan", loan_application, posting_date=posting_date)
+	loan.submit()
+
+	make_loan_disbursement_entry(loan.name, loan.loan_amount, disbursement_date=posting_date)
+
+	return loan
+
+
+# (account_name, parent_account, root_type, account_type, report_type, is_group)
+# The group account comes first so children always find their parent.
+LOAN_ACCOUNT_SPECS = [
+	("Loans and Advances (Assets)", "Current Assets - _TC", "Asset", "Bank", "Balance Sheet", 1),
+	("Loan Account", "Loans and Advances (Assets) - _TC", "Asset", "Receivable", "Balance Sheet", 0),
+	("Payment Account", "Bank Accounts - _TC", "Asset", "Bank", "Balance Sheet", 0),
+	("Disbursement Account", "Bank Accounts - _TC", "Asset", "Bank", "Balance Sheet", 0),
+	("Interest Income Account", "Direct Income - _TC", "Income", "Income Account", "Profit and Loss", 0),
+	("Penalty Income Account", "Direct Income - _TC", "Income", "Income Account", "Profit and Loss", 0),
+	(
 		"Interest Receivable",
 		"Loans and Advances (Assets) - _TC",
 		"Asset",
 		"Receivable",
 		"Balance Sheet",
-	)
-	create_account(
-		"Charges Receivable", "Loans and Advances (Assets) - _TC", "Asset", "Receivable", "Balance Sheet"
-	)
-	create_account(
-		"Penalty Receivable", "Loans and Advances (Assets) - _TC", "Asset", "Receivable", "Balance Sheet"
-	)
-	create_account(
+		0,
+	),
+	(
+		"Charges Receivable",
+		"Loans and Advances (Assets) - _TC",
+		"Asset",
+		"Receivable",
+		"Balance Sheet",
+		0,
+	),
+	(
+		"Penalty Receivable",
+		"Loans and Advances (Assets) - _TC",
+		"Asset",
+		"Receivable",
+		"Balance Sheet",
+		0,
+	),
+	(
 		"Suspense Interest Receivable",
 		"Loans and Advances (Assets) - _TC",
 		"Asset",
 		"Receivable",
 		"Balance Sheet",
+		0,
+	),
+	("Suspense Income Account", "Direct Income - _TC", "Income", "Income Account", "Profit and Loss", 0),
+]
+
+
+def create_loan_accounts():
+	# One existence query for all accounts instead of one per create_account
+	# call. A raw bulk INSERT is not an option here: Account is a tree doctype
+	# and insert() maintains the nested-set bounds of the chart.
+	wanted = {spec[0] for spec in LOAN_ACCOUNT_SPECS}
+	existing = set(
+		frappe.db.get_all(
+			"Account", filters={"account_name": ("in", list(wanted))}, pluck="account_name"
+		)
 	)
-	create_account(
-		"Suspense Income Account", "Direct Income - _TC", "Income", "Income Account", "Profit and Loss"
-	)
+
+	# Common rerun path: every account is already there
+	if wanted <= existing:
+		return
+
+	for account_name, parent_account, root_type, account_type, report_type, is_group in LOAN_ACCOUNT_SPECS:
+		if account_name not in existing:
+			create_account(account_name, parent_account, root_type, account_type, report_type, is_group)
 
 
 def create_account(account_name, parent_account, root_type, account_type, report_type, is_group=0):
@@ -1068,7 +978,12 @@ def create_loan_product(
 				"product_code": product_code,
 				"product_name": product_name,
 				"is_term_loan": is_term_loan,
-				"repayment_schedule_type": "Monthly as per repayment start date",
+				"repayment_schedule_type": repayment_schedule_type
+				if is_term_loan
+				else "Monthly as per repayment start date",
+				"repayment_date_on": repayment_date_on
+				if is_term_loan and repayment_schedule_type != "Monthly as per repayment start date"
+				else None,
 				"maximum_loan_amount": maximum_loan_amount,
 				"rate_of_interest": rate_of_interest,
 				"penalty_interest_rate": penalty_interest_rate,
@@ -1093,11 +1008,6 @@ def create_loan_product(
 			}
 		)
 
-		if loan_product.is_term_loan:
-			loan_product.repayment_schedule_type = repayment_schedule_type
-			if loan_product.repayment_schedule_type != "Monthly as per repayment start date":
-				loan_product.repayment_date_on = repayment_date_on
-
 		loan_product.insert()
 
 		return loan_product
@@ -1116,45 +1026,51 @@ def create_loan_security_type():
 		).insert(ignore_permissions=True)
 
 
-def create_loan_security():
-	if not frappe.db.exists("Loan Security", "Test Security 1"):
-		frappe.get_doc(
-			{
-				"doctype": "Loan Security",
-				"loan_security_type": "Stock",
-				"loan_security_code": "532779",
-				"loan_security_name": "Test Security 1",
-				"unit_of_measure": "Nos",
-				"haircut": 50.00,
-			}
-		).insert(ignore_permissions=True)
+# (loan_security_name, loan_security_code)
+LOAN_SECURITIES = [
+	("Test Security 1", "532779"),
+	("Test Security 2", "531335"),
+]
 
-	if not frappe.db.exists("Loan Security", "Test Security 2"):
-		frappe.get_doc(
-			{
-				"doctype": "Loan Security",
-				"loan_security_type": "Stock",
-				"loan_security_code": "531335",
-				"loan_security_name": "Test Security 2",
-				"unit_of_measure": "Nos",
-				"haircut": 50.00,
-			}
-		).insert(ignore_permissions=True)
 
+def create_loan_security():
+	existing = set(
+		frappe.db.get_all(
+			"Loan Security",
+			filters={"name": ("in", [name for name, _code in LOAN_SECURITIES])},
+			pluck="name",
+		)
+	)
 
-def create_loan_security_pledge(applicant, pledges, loan_application=None, loan=None):
+	for name, code in LOAN_SECURITIES:
+		if name not in existing:
+			frappe.get_doc(
+				{
+					"doctype": "Loan Security",
+					"loan_security_type": "Stock",
+					"loan_security_code": code,
+					"loan_security_name": name,
+					"unit_of_measure": "Nos",
+					"haircut": 50.00,
+				}
+			).insert(ignore_permissions=True)
 
-	lsp = frappe.new_doc("Loan Security Pledge")
-	lsp.applicant_type = "Customer"
-	lsp.applicant = applicant
-	lsp.company = "_Test Company"
-	lsp.loan_application = loan_application
 
-	if loan:
-		lsp.loan = loan
+def create_loan_security_pledge(applicant, pledges, loan_application=None, loan=None):
 
-	for pledge in pledges:
-		lsp.append("securities", {"loan_security": pledge["loan_security"], "qty": pledge["qty"]})
+	lsp = frappe.get_doc(
+		{
+			"doctype": "Loan Security Pledge",
+			"applicant_type": "Customer",
+			"applicant": applicant,
+			"company": "_Test Company",
+			"loan_application": loan_application,
+			"loan": loan,
+			"securities": [
+				{"loan_security": pledge["loan_security"], "qty": pledge["qty"]} for pledge in pledges
+			],
+		}
+	)
 
 	lsp.save()
 	lsp.submit()
@@ -1175,7 +1091,6 @@ def make_loan_disbursement_entry(loan, amount, disbursement_date=None):
 		}
 	).insert(ignore_permissions=True)
 
-	loan_disbursement_entry.save()
 	loan_disbursement_entry.submit()
 
 	return loan_disbursement_entry
@@ -1201,6 +1116,44 @@ def create_loan_security_price(loan_security, loan_security_price, uom, from_dat
 		).insert(ignore_permissions=True)
 
 
+def create_loan_security_prices(prices, uom, from_date, to_date):
+	# one existence query for all securities instead of one per price
+	existing = set(
+		frappe.db.get_all(
+			"Loan Security Price",
+			filters={
+				"loan_security": ("in", list(prices)),
+				"valid_from": ("<=", from_date),
+				"valid_upto": (">=", to_date),
+			},
+			pluck="loan_security",
+		)
+	)
+
+	for loan_security, price in prices.items():
+		if loan_security not in existing:
+			frappe.get_doc(
+				{
+					"doctype": "Loan Security Price",
+					"loan_security": loan_security,
+					"loan_security_price": price,
+					"uom": uom,
+					"valid_from": from_date,
+					"valid_upto": to_date,
+				}
+			).insert(ignore_permissions=True)
+
+
+def set_loan_security_price(loan_security, price):
+	frappe.db.set_value(
+		"Loan Security Price",
+		{"loan_security": loan_security},
+		"loan_security_price",
+		price,
+		update_modified=False,
+	)
+
+
 def create_repayment_entry(loan, applicant, posting_date, paid_amount, offset_based_on_npa=0):
 	lr = frappe.get_doc(
 		{
@@ -1228,20 +1181,20 @@ def create_loan_application(
 	posting_date=None,
 	do_not_save=False,
 ):
-	loan_application = frappe.new_doc("Loan Application")
-	loan_application.applicant_type = "Customer"
-	loan_application.company = company
-	loan_application.applicant = applicant
-	loan_application.loan_product = loan_product
-	loan_application.posting_date = posting_date or nowdate()
-	loan_application.is_secured_loan = 1
-
-	if repayment_method:
-		loan_application.repayment_method = repayment_method
-		loan_application.repayment_periods = repayment_periods
-
-	for pledge in proposed_pledges:
-		loan_application.append("proposed_pledges", pledge)
+	loan_application = frappe.get_doc(
+		{
+			"doctype": "Loan Application",
+			"applicant_type": "Customer",
+			"company": company,
+			"applicant": applicant,
+			"loan_product": loan_product,
+			"posting_date": posting_date or nowdate(),
+			"is_secured_loan": 1,
+			"repayment_method": repayment_method,
+			"repayment_periods": repayment_periods if repayment_method else None,
+			"proposed_pledges": proposed_pledges,
+		}
+	)
 
 	if do_not_save:
 		return loan_application
@@ -1285,6 +1238,20 @@ def create_loan(
 	return loan
 
 
+# constant keys shared by the secured loan factories below; copied and
+# updated per call instead of rebuilding the full dict every time
+SECURED_LOAN_PROTOTYPE = {
+	"doctype": "Loan",
+	"company": "_Test Company",
+	"applicant_type": "Customer",
+	"is_secured_loan": 1,
+	"payment_account": "Payment Account - _TC",
+	"loan_account": "Loan Account - _TC",
+	"interest_income_account": "Interest Income Account - _TC",
+	"penalty_income_account": "Penalty Income Account - _TC",
+}
+
+
 def create_loan_with_security(
 	applicant,
 	loan_product,
@@ -1294,52 +1261,39 @@ def create_loan_with_security(
 	posting_date=None,
 	repayment_start_date=None,
 ):
-	loan = frappe.get_doc(
+	loan_dict = SECURED_LOAN_PROTOTYPE.copy()
+	loan_dict.update(
 		{
-			"doctype": "Loan",
-			"company": "_Test Company",
-			"applicant_type": "Customer",
 			"posting_date": posting_date or nowdate(),
 			"loan_application": loan_application,
 			"applicant": applicant,
 			"loan_product": loan_product,
 			"is_term_loan": 1,
-			"is_secured_loan": 1,
 			"repayment_method": repayment_method,
 			"repayment_periods": repayment_periods,
 			"repayment_start_date": repayment_start_date or nowdate(),
-			"payment_account": "Payment Account - _TC",
-			"loan_account": "Loan Account - _TC",
-			"interest_income_account": "Interest Income Account - _TC",
-			"penalty_income_account": "Penalty Income Account - _TC",
 		}
 	)
 
+	loan = frappe.get_doc(loan_dict)
 	loan.save()
 
 	return loan
 
 
 def create_demand_loan(applicant, loan_product, loan_application, posting_date=None):
-
-	loan = frappe.get_doc(
+	loan_dict = SECURED_LOAN_PROTOTYPE.copy()
+	loan_dict.update(
 		{
-			"doctype": "Loan",
-			"company": "_Test Company",
-			"applicant_type": "Customer",
 			"posting_date": posting_date or nowdate(),
 			"loan_application": loan_application,
 			"applicant": applicant,
 			"loan_product": loan_product,
 			"is_term_loan": 0,
-			"is_secured_loan": 1,
-			"payment_account": "Payment Account - _TC",
-			"loan_account": "Loan Account - _TC",
-			"interest_income_account": "Interest Income Account - _TC",
-			"penalty_income_account": "Penalty Income Account - _TC",
 		}
 	)
 
+	loan = frappe.get_doc(loan_dict)
 	loan.save()
 
 	return loan
@@ -1348,6 +1302,11 @@ def create_demand_loan(applicant, loan_product, loan_application, posting_date=N
 def set_loan_settings_in_company(company=None):
 	if not company:
 		company = "_Test Company"
+
+	# Skip the full document save when the setting is already in place
+	if frappe.db.get_value("Company", company, "min_days_bw_disbursement_first_repayment") == 15:
+		return
+
 	company = frappe.get_doc("Company", company)
 	company.min_days_bw_disbursement_first_repayment = 15
 	company.save()
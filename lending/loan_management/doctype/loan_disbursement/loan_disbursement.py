@@ -292,27 +292,29 @@ class LoanDisbursement(AccountsController):
 def get_total_pledged_security_value(loan):
 	update_time = get_datetime()
 
-	loan_security_price_map = frappe._dict(
-		frappe.get_all(
-			"Loan Security Price",
-			fields=["loan_security", "loan_security_price"],
-			filters={"valid_from": ("<=", update_time), "valid_upto": (">=", update_time)},
-			as_list=1,
-		)
-	)
-
-	hair_cut_map = frappe._dict(
-		frappe.get_all("Loan Security", fields=["name", "haircut"], as_list=1)
-	)
+	loan_security = frappe.qb.DocType("Loan Security")
+	loan_security_price = frappe.qb.DocType("Loan Security Price")
+
+	# single query instead of separate price and haircut maps, and a single
+	# lookup per security in the loop below
+	security_details = {
+		security: (price, haircut)
+		for security, price, haircut in (
+			frappe.qb.from_(loan_security)
+			.inner_join(loan_security_price)
+			.on(loan_security_price.loan_security == loan_security.name)
+			.select(loan_security.name, loan_security_price.loan_security_price, loan_security.haircut)
+			.where(loan_security_price.valid_from <= update_time)
+			.where(loan_security_price.valid_upto >= update_time)
+		).run()
+	}
 
 	security_value = 0.0
 	pledged_securities = get_pledged_security_qty(loan)
 
 	for security, qty in pledged_securities.items():
-		after_haircut_percentage = 100 - hair_cut_map.get(security)
-		security_value += (
-			loan_security_price_map.get(security, 0) * qty * after_haircut_percentage
-		) / 100
+		price, haircut = security_details.get(security, (0, 0))
+		security_value += (price * qty * (100 - haircut)) / 100
 
 	return security_value
 
@@ -9,6 +9,8 @@ from frappe.utils import add_days, cint, date_diff, flt, get_datetime, getdate,
 from erpnext.accounts.general_ledger import make_gl_entries
 from erpnext.controllers.accounts_controller import AccountsController
 
+ACCRUAL_BATCH_SIZE = 5000
+
 
 class LoanInterestAccrual(AccountsController):
 	def validate(self):
@@ -38,13 +40,26 @@ class LoanInterestAccrual(AccountsController):
 		frappe.db.set_value("Repayment Schedule", self.repayment_schedule_name, "is_accrued", 0)
 
 	def make_gl_entries(self, cancel=0, adv_adj=0):
+		# principal-only accruals post no GL entries; skip the account lookups
+		# entirely for them
+		if not self.interest_amount:
+			return
+
 		gle_map = []
 
-		cost_center, loan_product = frappe.db.get_value(
-			"Loan", self.loan, ["cost_center", "loan_product"]
-		)
+		# accrual batch runs preload these per loan; fall back to a query for
+		# single-doc submits and cancellations
+		batch_ctx = frappe.flags.get("loan_accrual_batch_ctx") or {}
+		if self.loan in batch_ctx:
+			cost_center, loan_product = batch_ctx[self.loan]
+		else:
+			cost_center, loan_product = frappe.db.get_value(
+				"Loan", self.loan, ["cost_center", "loan_product"]
+			)
 
-		account_details = frappe.db.get_value(
+		# account configuration rarely changes, so hit the document cache instead
+		# of the database for every accrual in a batch
+		account_details = frappe.get_cached_value(
 			"Loan Product",
 			loan_product,
 			["interest_receivable_account", "suspense_interest_receivable", "suspense_interest_income"],
@@ -58,46 +73,51 @@ class LoanInterestAccrual(AccountsController):
 			receivable_account = account_details.interest_receivable_account
 			income_account = self.interest_income_account
 
-		if self.interest_amount:
-			gle_map.append(
-				self.get_gl_dict(
-					{
-						"account": receivable_account,
-						"party_type": self.applicant_type,
-						"party": self.applicant,
-						"against": income_account,
-						"debit": self.interest_amount,
-						"debit_in_account_currency": self.interest_amount,
-						"against_voucher_type": "Loan",
-						"against_voucher": self.loan,
-						"remarks": _("Interest accrued from {0} to {1} against loan: {2}").format(
-							self.last_accrual_date, self.posting_date, self.loan
-						),
-						"cost_center": cost_center,
-						"posting_date": self.posting_date,
-					}
-				)
+		# both legs share the same remark; format it once
+		remarks = _("Interest accrued from {0} to {1} against loan: {2}").format(
+			self.last_accrual_date, self.posting_date, self.loan
+		)
+
+		gle_map.append(
+			self.get_gl_dict(
+				{
+					"account": receivable_account,
+					"party_type": self.applicant_type,
+					"party": self.applicant,
+					"against": income_account,
+					"debit": self.interest_amount,
+					"debit_in_account_currency": self.interest_amount,
+					"against_voucher_type": "Loan",
+					"against_voucher": self.loan,
+					"remarks": remarks,
+					"cost_center": cost_center,
+					"posting_date": self.posting_date,
+				}
 			)
+		)
 
-			gle_map.append(
-				self.get_gl_dict(
-					{
-						"account": income_account,
-						"against": receivable_account,
-						"credit": self.interest_amount,
-						"credit_in_account_currency": self.interest_amount,
-						"against_voucher_type": "Loan",
-						"against_voucher": self.loan,
-						"remarks": ("Interest accrued from {0} to {1} against loan: {2}").format(
-							self.last_accrual_date, self.posting_date, self.loan
-						),
-						"cost_center": cost_center,
-						"posting_date": self.posting_date,
-					}
-				)
+		gle_map.append(
+			self.get_gl_dict(
+				{
+					"account": income_account,
+					"against": receivable_account,
+					"credit": self.interest_amount,
+					"credit_in_account_currency": self.interest_amount,
+					"against_voucher_type": "Loan",
+					"against_voucher": self.loan,
+					"remarks": remarks,
+					"cost_center": cost_center,
+					"posting_date": self.posting_date,
+				}
 			)
+		)
 
-		if gle_map:
+		# batch runs collect entries from every accrual and post them in one
+		# call after the loop; cancellations always post immediately
+		deferred_entries = frappe.flags.get("deferred_loan_accrual_gl_entries")
+		if deferred_entries is not None and not cancel and not adv_adj:
+			deferred_entries.extend(gle_map)
+		else:
 			make_gl_entries(gle_map, cancel=cancel, adv_adj=adv_adj)
 
 
@@ -105,19 +125,21 @@ class LoanInterestAccrual(AccountsController):
 # rate of interest is 13.5 then first loan interest accrual will be on '01-10-2019'
 # which means interest will be accrued for 30 days which should be equal to 11095.89
 def calculate_accrual_amount_for_demand_loans(
-	loan, posting_date, process_loan_interest, accrual_type
+	loan, posting_date, process_loan_interest, accrual_type, last_accrual_date=None, precision=None
 ):
 	from lending.loan_management.doctype.loan_repayment.loan_repayment import (
 		calculate_amounts,
 		get_pending_principal_amount,
 	)
 
-	no_of_days = get_no_of_days_for_interest_accural(loan, posting_date)
-	precision = cint(frappe.db.get_default("currency_precision")) or 2
+	no_of_days = get_no_of_days_for_interest_accural(loan, posting_date, last_accrual_date)
 
 	if no_of_days <= 0:
 		return
 
+	if not precision:
+		precision = cint(frappe.db.get_default("currency_precision")) or 2
+
 	pending_principal_amount = get_pending_principal_amount(loan)
 
 	if loan.is_term_loan:
@@ -147,11 +169,12 @@ def calculate_accrual_amount_for_demand_loans(
 			"posting_date": posting_date,
 			"due_date": posting_date,
 			"accrual_type": accrual_type,
+			"last_accrual_date": last_accrual_date,
 		}
 	)
 
 	if flt(payable_interest, precision) > 0.0:
-		make_loan_interest_accrual_entry(args)
+		make_loan_interest_accrual_entry(args, precision)
 
 
 def make_accrual_interest_entry_for_demand_loans(
@@ -173,39 +196,83 @@ def make_accrual_interest_entry_for_demand_loans(
 	if loan_product:
 		query_filters.update({"loan_product": loan_product})
 
-	if not open_loans:
+	if open_loans:
+		accrue_interest_for_demand_loans(open_loans, posting_date, process_loan_interest, accrual_type)
+		return
+
+	loan_fields = [
+		"name",
+		"total_payment",
+		"total_amount_paid",
+		"debit_adjustment_amount",
+		"credit_adjustment_amount",
+		"refund_amount",
+		"loan_account",
+		"interest_income_account",
+		"loan_amount",
+		"is_term_loan",
+		"status",
+		"disbursement_date",
+		"disbursed_amount",
+		"applicant_type",
+		"applicant",
+		"rate_of_interest",
+		"total_interest_payable",
+		"written_off_amount",
+		"total_principal_paid",
+		"repayment_start_date",
+		"company",
+		"cost_center",
+		"loan_product",
+	]
+
+	# keyset pagination keeps memory bounded for large portfolios instead of
+	# materializing every open loan at once
+	last_loan = ""
+	while True:
+		query_filters["name"] = (">", last_loan)
 		open_loans = frappe.get_all(
 			"Loan",
-			fields=[
-				"name",
-				"total_payment",
-				"total_amount_paid",
-				"debit_adjustment_amount",
-				"credit_adjustment_amount",
-				"refund_amount",
-				"loan_account",
-				"interest_income_account",
-				"loan_amount",
-				"is_term_loan",
-				"status",
-				"disbursement_date",
-				"disbursed_amount",
-				"applicant_type",
-				"applicant",
-				"rate_of_interest",
-				"total_interest_payable",
-				"written_off_amount",
-				"total_principal_paid",
-				"repayment_start_date",
-				"company",
-			],
+			fields=loan_fields,
 			filters=query_filters,
+			order_by="name",
+			limit_page_length=ACCRUAL_BATCH_SIZE,
 		)
 
-	for loan in open_loans:
-		calculate_accrual_amount_for_demand_loans(
-			loan, posting_date, process_loan_interest, accrual_type
-		)
+		if not open_loans:
+			break
+
+		accrue_interest_for_demand_loans(open_loans, posting_date, process_loan_interest, accrual_type)
+		last_loan = open_loans[-1].name
+
+
+def accrue_interest_for_demand_loans(open_loans, posting_date, process_loan_interest, accrual_type):
+	last_accrual_date_map = get_last_accrual_date_map([loan.name for loan in open_loans], posting_date)
+	precision = cint(frappe.db.get_default("currency_precision")) or 2
+
+	frappe.flags.loan_accrual_batch_ctx = {
+		loan.name: (loan.cost_center, loan.loan_product) for loan in open_loans
+	}
+	frappe.flags.deferred_loan_accrual_gl_entries = deferred_gl_entries = []
+
+	try:
+		for loan in open_loans:
+			calculate_accrual_amount_for_demand_loans(
+				loan,
+				posting_date,
+				process_loan_interest,
+				accrual_type,
+				last_accrual_date=last_accrual_date_map.get(loan.name) or loan.disbursement_date,
+				precision=precision,
+			)
+	finally:
+		frappe.flags.pop("loan_accrual_batch_ctx", None)
+		frappe.flags.pop("deferred_loan_accrual_gl_entries", None)
+
+	# merging would coalesce legs of different accrual vouchers for the same
+	# loan into one GL Entry; keep each accrual's pair under its own voucher
+	if deferred_gl_entries:
+		make_gl_entries(deferred_gl_entries, merge_entries=False)
 
 
 def make_accrual_interest_entry_for_term_loans(
@@ -215,28 +282,48 @@ def make_accrual_interest_entry_for_term_loans(
 
 	term_loans = get_term_loans(curr_date, term_loan, loan_product)
 
+	precision = cint(frappe.db.get_default("currency_precision")) or 2
 	accrued_entries = []
 
-	for loan in term_loans:
-		accrued_entries.append(loan.payment_entry)
-		args = frappe._dict(
-			{
-				"loan": loan.name,
-				"applicant_type": loan.applicant_type,
-				"applicant": loan.applicant,
-				"interest_income_account": loan.interest_income_account,
-				"loan_account": loan.loan_account,
-				"interest_amount": loan.interest_amount,
-				"payable_principal": loan.principal_amount,
-				"process_loan_interest": process_loan_interest,
-				"repayment_schedule_name": loan.payment_entry,
-				"posting_date": posting_date,
-				"accrual_type": accrual_type,
-				"due_date": loan.payment_date,
-			}
-		)
+	last_accrual_date_map = get_last_accrual_date_map(
+		list({loan.name for loan in term_loans}), curr_date
+	)
+
+	frappe.flags.loan_accrual_batch_ctx = {
+		loan.name: (loan.cost_center, loan.loan_product) for loan in term_loans
+	}
+	frappe.flags.deferred_loan_accrual_gl_entries = deferred_gl_entries = []
+
+	try:
+		for loan in term_loans:
+			accrued_entries.append(loan.payment_entry)
+			args = frappe._dict(
+				{
+					"loan": loan.name,
+					"applicant_type": loan.applicant_type,
+					"applicant": loan.applicant,
+					"interest_income_account": loan.interest_income_account,
+					"loan_account": loan.loan_account,
+					"interest_amount": loan.interest_amount,
+					"payable_principal": loan.principal_amount,
+					"process_loan_interest": process_loan_interest,
+					"repayment_schedule_name": loan.payment_entry,
+					"posting_date": posting_date,
+					"accrual_type": accrual_type,
+					"due_date": loan.payment_date,
+					"last_accrual_date": last_accrual_date_map.get(loan.name) or loan.disbursement_date,
+				}
+			)
+
+			make_loan_interest_accrual_entry(args, precision)
+	finally:
+		frappe.flags.pop("loan_accrual_batch_ctx", None)
+		frappe.flags.pop("deferred_loan_accrual_gl_entries", None)
 
-		make_loan_interest_accrual_entry(args)
+	# merging would coalesce legs of different accrual vouchers for the same
+	# loan into one GL Entry; keep each accrual's pair under its own voucher
+	if deferred_gl_entries:
+		make_gl_entries(deferred_gl_entries, merge_entries=False)
 
 	if accrued_entries:
 		frappe.db.sql(
@@ -271,6 +358,8 @@ def get_term_loans(date, term_loan=None, loan_product=None):
 			loan.rate_of_interest,
 			loan.total_interest_payable,
 			loan.repayment_start_date,
+			loan.cost_center,
+			loan.loan_product,
 			loan_repayment_schedule.name.as_("payment_entry"),
 			loan_repayment_schedule.payment_date,
 			loan_repayment_schedule.principal_amount,
@@ -301,8 +390,9 @@ def get_term_loans(date, term_loan=None, loan_product=None):
 	return term_loans
 
 
-def make_loan_interest_accrual_entry(args):
-	precision = cint(frappe.db.get_default("currency_precision")) or 2
+def make_loan_interest_accrual_entry(args, precision=None):
+	if not precision:
+		precision = cint(frappe.db.get_default("currency_precision")) or 2
 
 	loan_interest_accrual = frappe.new_doc("Loan Interest Accrual")
 	loan_interest_accrual.loan = args.loan
@@ -322,19 +412,64 @@ def make_loan_interest_accrual_entry(args):
 	loan_interest_accrual.payable_principal_amount = args.payable_principal
 	loan_interest_accrual.accrual_type = args.accrual_type
 	loan_interest_accrual.due_date = args.due_date
+	loan_interest_accrual.last_accrual_date = args.last_accrual_date
 
-	loan_interest_accrual.save()
+	# submit() on a new doc saves it in the same pass, avoiding a separate
+	# INSERT + UPDATE (and double validation) per accrual in large batches
 	loan_interest_accrual.submit()
 
 
-def get_no_of_days_for_interest_accural(loan, posting_date):
-	last_interest_accrual_date = get_last_accrual_date(loan.name, posting_date)
+def get_no_of_days_for_interest_accural(loan, posting_date, last_accrual_date=None):
+	if not last_accrual_date:
+		last_accrual_date = get_last_accrual_date(loan.name, posting_date)
 
-	no_of_days = date_diff(posting_date or nowdate(), last_interest_accrual_date) + 1
+	no_of_days = date_diff(posting_date or nowdate(), last_accrual_date) + 1
 
 	return no_of_days
 
 
+def get_last_accrual_date_map(loans, posting_date):
+	# batched version of get_last_accrual_date for accrual runs across many
+	# loans: two grouped queries instead of two queries per loan. Loans with
+	# no accrual yet are absent from the map; callers fall back to the
+	# disbursement date they already hold.
+	if not loans:
+		return {}
+
+	last_accrual_dates = dict(
+		frappe.db.sql(
+			""" SELECT loan, MAX(posting_date) from `tabLoan Interest Accrual`
+			WHERE loan in %(loans)s and docstatus = 1 GROUP BY loan""",
+			{"loans": loans},
+		)
+	)
+
+	last_disbursement_dates = dict(
+		frappe.db.sql(
+			""" SELECT against_loan, MAX(posting_date) from `tabLoan Disbursement`
+			WHERE against_loan in %(loans)s and docstatus = 1 and posting_date < %(posting_date)s
+			GROUP BY against_loan""",
+			{"loans": loans, "posting_date": posting_date},
+		)
+	)
+
+	accrual_date_map = {}
+	for loan in loans:
+		last_interest_accrual_date = last_accrual_dates.get(loan)
+		if not last_interest_accrual_date:
+			continue
+
+		last_disbursement_date = last_disbursement_dates.get(loan)
+		if last_disbursement_date and getdate(last_disbursement_date) > add_days(
+			getdate(last_interest_accrual_date), 1
+		):
+			last_interest_accrual_date = last_disbursement_date
+
+		accrual_date_map[loan] = add_days(last_interest_accrual_date, 1)
+
+	return accrual_date_map
+
+
 def get_last_accrual_date(loan, posting_date):
 	last_posting_date = frappe.db.sql(
 		""" SELECT MAX(posting_date) from `tabLoan Interest Accrual`
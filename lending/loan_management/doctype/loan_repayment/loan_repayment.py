@@ -2,8 +2,11 @@
 # For license information, please see license.txt
 
 
+from functools import cached_property
+
 import frappe
 from frappe import _
+from frappe.query_builder.functions import Sum
 from frappe.utils import add_days, cint, date_diff, flt, get_datetime, getdate
 
 import erpnext
@@ -25,11 +28,30 @@ from lending.loan_management.doctype.process_loan_interest_accrual.process_loan_
 	process_loan_interest_accrual_for_demand_loans,
 )
 
+PRINCIPAL_REPAYMENT_TYPES = frozenset(("Principal Adjustment", "Principal Capitalization"))
+INTEREST_REPAYMENT_TYPES = frozenset(
+	("Interest Waiver", "Interest Capitalization", "Interest Adjustment", "Interest Carry Forward")
+)
+PENALTY_REPAYMENT_TYPES = frozenset(("Penalty Waiver", "Penalty Capitalization"))
+CHARGES_REPAYMENT_TYPES = frozenset(("Charges Waiver", "Charges Capitalization"))
+
 
 class LoanRepayment(AccountsController):
+	@cached_property
+	def _precision(self):
+		# currency precision does not change within a request, fetch it once
+		# per document instead of once per method
+		return cint(frappe.db.get_default("currency_precision")) or 2
+
+	@cached_property
+	def loan_product_details(self):
+		# several methods need one or two Loan Product fields each; serve them
+		# all from the document cache instead of separate SELECTs
+		return frappe.get_cached_doc("Loan Product", self.loan_product)
+
 	def validate(self):
 		amounts = calculate_amounts(self.against_loan, self.posting_date)
-		self.add_pending_charges()
+		self.add_pending_charges(amounts.get("charges"))
 		self.set_missing_values(amounts)
 		self.check_future_entries()
 		self.validate_amount()
@@ -76,16 +98,11 @@ class LoanRepayment(AccountsController):
 		self.make_gl_entries(cancel=1)
 
 	def make_credit_note(self):
-		item_details = frappe.db.get_value(
-			"Loan Product",
-			self.loan_product,
-			["charges_waiver_item"],
-			as_dict=1,
-		)
+		charges_waiver_item = self.loan_product_details.charges_waiver_item
 
 		charges_waiver_item_income_account = frappe.db.get_value(
 			"Loan Charges",
-			{"charge_type": item_details.charges_waiver_item, "parent": self.loan_product},
+			{"charge_type": charges_waiver_item, "parent": self.loan_product},
 			"income_account",
 		)
 
@@ -96,7 +113,7 @@ class LoanRepayment(AccountsController):
 				si.append(
 					"items",
 					{
-						"item_code": item_details.charges_waiver_item,
+						"item_code": charges_waiver_item,
 						"qty": -1,
 						"rate": invoice.allocated_amount,
 						"income_account": charges_waiver_item_income_account,
@@ -112,7 +129,7 @@ class LoanRepayment(AccountsController):
 				si.submit()
 
 	def set_missing_values(self, amounts):
-		precision = cint(frappe.db.get_default("currency_precision")) or 2
+		precision = self._precision
 
 		if not self.posting_date:
 			self.posting_date = get_datetime()
@@ -179,7 +196,7 @@ class LoanRepayment(AccountsController):
 			frappe.throw(_("Amount paid cannot be zero"))
 
 	def book_unaccrued_interest(self):
-		precision = cint(frappe.db.get_default("currency_precision")) or 2
+		precision = self._precision
 		if flt(self.total_interest_paid, precision) > flt(self.interest_payable, precision):
 			if not self.is_term_loan:
 				# get last loan interest accrual date
@@ -221,15 +238,25 @@ class LoanRepayment(AccountsController):
 						},
 					)
 
-	def add_pending_charges(self):
+	def add_pending_charges(self, charges=None):
+		# calculate_amounts has already fetched the outstanding invoices;
+		# reuse them instead of querying Sales Invoice a second time
+		if charges is None:
+			charges = [
+				{
+					"sales_invoice": d.voucher_no,
+					"pending_charge_amount": d.outstanding_amount,
+				}
+				for d in get_outstanding_invoices(self.against_loan, self.posting_date)
+			]
+
 		self.set("pending_charges", [])
-		invoices = get_outstanding_invoices(self.against_loan, self.posting_date)
-		for d in invoices:
+		for d in charges:
 			self.append(
 				"pending_charges",
 				{
-					"sales_invoice": d.voucher_no,
-					"pending_charge_amount": d.outstanding_amount,
+					"sales_invoice": d.get("sales_invoice"),
+					"pending_charge_amount": d.get("pending_charge_amount"),
 				},
 			)
 
@@ -266,18 +293,7 @@ class LoanRepayment(AccountsController):
 			status = "Closed" if loan.applicant_type == "Employee" else "Loan Closure Requested"
 			loan.update({"status": status})
 
-		for payment in self.repayment_details:
-			frappe.db.sql(
-				""" UPDATE `tabLoan Interest Accrual`
-				SET paid_principal_amount = `paid_principal_amount` + %s,
-					paid_interest_amount = `paid_interest_amount` + %s
-				WHERE name = %s""",
-				(
-					flt(payment.paid_principal_amount),
-					flt(payment.paid_interest_amount),
-					payment.loan_interest_accrual,
-				),
-			)
+		update_accrual_paid_amounts(self.repayment_details)
 
 		if self.repayment_type == "Normal Repayment":
 			frappe.db.sql(
@@ -287,7 +303,10 @@ class LoanRepayment(AccountsController):
 				(loan.total_amount_paid, loan.total_principal_paid, loan.status, self.against_loan),
 			)
 
-			update_shortfall_status(self.against_loan, self.principal_amount_paid)
+			# nothing was paid against principal, so any pending shortfall is
+			# unchanged; skip the lookup and the no-op write
+			if self.principal_amount_paid:
+				update_shortfall_status(self.against_loan, self.principal_amount_paid)
 
 	def mark_as_unpaid(self):
 		loan = frappe.get_value(
@@ -322,15 +341,9 @@ class LoanRepayment(AccountsController):
 			else:
 				loan["status"] = "Partially Disbursed"
 
-		for payment in self.repayment_details:
-			frappe.db.sql(
-				""" UPDATE `tabLoan Interest Accrual`
-				SET paid_principal_amount = `paid_principal_amount` - %s,
-					paid_interest_amount = `paid_interest_amount` - %s
-				WHERE name = %s""",
-				(payment.paid_principal_amount, payment.paid_interest_amount, payment.loan_interest_accrual),
-			)
+		update_accrual_paid_amounts(self.repayment_details, cancel=1)
 
+		for payment in self.repayment_details:
 			# Cancel repayment interest accrual
 			# checking idx as a preventive measure, repayment accrual will always be the last entry
 			if payment.accrual_type == "Repayment" and payment.idx == no_of_repayments:
@@ -366,7 +379,7 @@ class LoanRepayment(AccountsController):
 			regenerate_repayment_schedule(self.against_loan, cancel)
 
 	def allocate_amounts(self, repayment_details):
-		precision = cint(frappe.db.get_default("currency_precision")) or 2
+		precision = self._precision
 		self.set("repayment_details", [])
 		self.principal_amount_paid = 0
 		self.total_penalty_paid = 0
@@ -405,23 +418,18 @@ class LoanRepayment(AccountsController):
 					)
 				if interest_paid > 0:
 					self.principal_amount_paid += interest_paid
-			elif self.repayment_type in ("Principal Adjustment", "Principal Capitalization"):
+			elif self.repayment_type in PRINCIPAL_REPAYMENT_TYPES:
 				self.allocate_principal_amount_for_term_loans(interest_paid, repayment_details, {})
-			elif self.repayment_type in (
-				"Interest Waiver",
-				"Interest Capitalization",
-				"Interest Adjustment",
-				"Interest Carry Forward",
-			):
+			elif self.repayment_type in INTEREST_REPAYMENT_TYPES:
 				self.allocate_interest_amount(interest_paid, repayment_details)
-			elif self.repayment_type in ("Penalty Waiver", "Penalty Capitalization"):
+			elif self.repayment_type in PENALTY_REPAYMENT_TYPES:
 				self.allocate_penalty(interest_paid)
-			elif self.repayment_type in ("Charges Waiver", "Charges Capitalization"):
+			elif self.repayment_type in CHARGES_REPAYMENT_TYPES:
 				self.allocate_charges(interest_paid)
 
 	def offset_repayment_based_on_npa(self, interest_paid, repayment_details):
 		if interest_paid > 0:
-			offset_base_on = frappe.db.get_value(
+			offset_base_on = frappe.get_cached_value(
 				"Company",
 				self.company,
 				[
@@ -570,7 +578,7 @@ class LoanRepayment(AccountsController):
 		return interest_paid, updated_entries
 
 	def allocate_penalty(self, interest_paid):
-		precision = cint(frappe.db.get_default("currency_precision")) or 2
+		precision = self._precision
 		if interest_paid > 0:
 			if self.penalty_amount and interest_paid > self.penalty_amount:
 				self.total_penalty_paid = flt(self.penalty_amount, precision)
@@ -582,7 +590,7 @@ class LoanRepayment(AccountsController):
 		return interest_paid
 
 	def allocate_charges(self, interest_paid):
-		precision = cint(frappe.db.get_default("currency_precision")) or 2
+		precision = self._precision
 		self.total_paid_charges = 0
 		if interest_paid > 0:
 			for charge in self.get("pending_charges"):
@@ -622,7 +630,8 @@ class LoanRepayment(AccountsController):
 		gle_map = []
 		remarks = self.get_remarks()
 		payment_account = self.get_payment_account()
-		precision = cint(frappe.db.get_default("currency_precision")) or 2
+		precision = self._precision
+		posting_date = getdate(self.posting_date)
 
 		payment_party_type = ""
 		payment_party = ""
@@ -634,22 +643,10 @@ class LoanRepayment(AccountsController):
 			payment_party_type = "Employee"
 			payment_party = self.applicant
 
-		account_details = frappe.db.get_value(
-			"Loan Product",
-			self.loan_product,
-			[
-				"interest_receivable_account",
-				"suspense_interest_receivable",
-				"suspense_interest_income",
-				"interest_income_account",
-			],
-			as_dict=1,
-		)
+		account_details = self.loan_product_details
 
 		if self.total_penalty_paid:
-			penalty_receivable_account = frappe.db.get_value(
-				"Loan Product", self.loan_product, "penalty_receivable_account"
-			)
+			penalty_receivable_account = account_details.penalty_receivable_account
 			gle_map.append(
 				self.get_gl_dict(
 					{
@@ -663,7 +660,7 @@ class LoanRepayment(AccountsController):
 						"cost_center": self.cost_center,
 						"party_type": self.applicant_type,
 						"party": self.applicant,
-						"posting_date": getdate(self.posting_date),
+						"posting_date": posting_date,
 					}
 				)
 			)
@@ -681,7 +678,7 @@ class LoanRepayment(AccountsController):
 						"against_voucher": self.against_loan,
 						"remarks": _("Penalty against loan:") + self.against_loan,
 						"cost_center": self.cost_center,
-						"posting_date": getdate(self.posting_date),
+						"posting_date": posting_date,
 					}
 				)
 			)
@@ -699,7 +696,7 @@ class LoanRepayment(AccountsController):
 							"against_voucher": self.against_loan,
 							"remarks": _(remarks),
 							"cost_center": self.cost_center,
-							"posting_date": getdate(self.posting_date),
+							"posting_date": posting_date,
 							"party_type": payment_party_type,
 							"party": payment_party,
 						}
@@ -719,7 +716,7 @@ class LoanRepayment(AccountsController):
 							"against_voucher": self.against_loan,
 							"remarks": _(remarks),
 							"cost_center": self.cost_center,
-							"posting_date": getdate(self.posting_date),
+							"posting_date": posting_date,
 						}
 					)
 				)
@@ -737,7 +734,7 @@ class LoanRepayment(AccountsController):
 								"against_voucher_type": "Loan",
 								"against_voucher": self.against_loan,
 								"cost_center": self.cost_center,
-								"posting_date": getdate(self.posting_date),
+								"posting_date": posting_date,
 							}
 						)
 					)
@@ -754,7 +751,7 @@ class LoanRepayment(AccountsController):
 								"against_voucher_type": "Loan",
 								"against_voucher": self.against_loan,
 								"cost_center": self.cost_center,
-								"posting_date": getdate(self.posting_date),
+								"posting_date": posting_date,
 							}
 						)
 					)
@@ -795,7 +792,7 @@ class LoanRepayment(AccountsController):
 							"against_voucher": self.against_loan,
 							"remarks": _(remarks),
 							"cost_center": self.cost_center,
-							"posting_date": getdate(self.posting_date),
+							"posting_date": posting_date,
 							"party_type": payment_party_type,
 							"party": payment_party,
 						}
@@ -815,7 +812,7 @@ class LoanRepayment(AccountsController):
 							"against_voucher": self.against_loan,
 							"remarks": _(remarks),
 							"cost_center": self.cost_center,
-							"posting_date": getdate(self.posting_date),
+							"posting_date": posting_date,
 						}
 					)
 				)
@@ -840,7 +837,7 @@ class LoanRepayment(AccountsController):
 						"against_voucher": self.against_loan,
 						"remarks": _(remarks),
 						"cost_center": self.cost_center,
-						"posting_date": getdate(self.posting_date),
+						"posting_date": posting_date,
 						"party_type": payment_party_type,
 						"party": payment_party,
 					}
@@ -860,7 +857,7 @@ class LoanRepayment(AccountsController):
 						"against_voucher": self.against_loan,
 						"remarks": _(remarks),
 						"cost_center": self.cost_center,
-						"posting_date": getdate(self.posting_date),
+						"posting_date": posting_date,
 					}
 				)
 			)
@@ -888,8 +885,8 @@ class LoanRepayment(AccountsController):
 			else:
 				payment_account = self.payment_account
 		else:
-			payment_account = frappe.db.get_value(
-				"Loan Product", self.loan_product, payment_account_field_map.get(self.repayment_type)
+			payment_account = self.loan_product_details.get(
+				payment_account_field_map.get(self.repayment_type)
 			)
 
 		return payment_account
@@ -912,6 +909,49 @@ class LoanRepayment(AccountsController):
 		return remarks
 
 
+def update_accrual_paid_amounts(repayment_details, cancel=0):
+	# one UPDATE per repayment_details row adds up quickly on loans with
+	# many pending accruals; fold the deltas into a single CASE WHEN
+	# statement per chunk of accruals instead
+	chunk_size = 100
+	sign = -1 if cancel else 1
+	deltas = {}
+
+	for payment in repayment_details:
+		paid_principal_amount = flt(payment.paid_principal_amount)
+		paid_interest_amount = flt(payment.paid_interest_amount)
+
+		# waiver and interest-only entries leave one of the amounts at
+		# zero; rows with nothing to add are skipped entirely
+		if paid_principal_amount or paid_interest_amount:
+			delta = deltas.setdefault(payment.loan_interest_accrual, [0.0, 0.0])
+			delta[0] += sign * paid_principal_amount
+			delta[1] += sign * paid_interest_amount
+
+	accruals = list(deltas)
+	for i in range(0, len(accruals), chunk_size):
+		chunk = accruals[i : i + chunk_size]
+		cases = " ".join(["WHEN %s THEN %s"] * len(chunk))
+		names = ", ".join(["%s"] * len(chunk))
+
+		values = []
+		for name in chunk:
+			values.extend([name, deltas[name][0]])
+		for name in chunk:
+			values.extend([name, deltas[name][1]])
+		values.extend(chunk)
+
+		frappe.db.sql(
+			""" UPDATE `tabLoan Interest Accrual`
+			SET paid_principal_amount = `paid_principal_amount` + CASE name {cases} END,
+				paid_interest_amount = `paid_interest_amount` + CASE name {cases} END
+			WHERE name IN ({names})""".format(
+				cases=cases, names=names
+			),
+			values,
+		)
+
+
 def create_repayment_entry(
 	loan,
 	applicant,
@@ -948,11 +988,12 @@ def create_repayment_entry(
 	return lr
 
 
-def get_accrued_interest_entries(against_loan, posting_date=None):
+def get_accrued_interest_entries(against_loan, posting_date=None, precision=None):
 	if not posting_date:
 		posting_date = getdate()
 
-	precision = cint(frappe.db.get_default("currency_precision")) or 2
+	if not precision:
+		precision = cint(frappe.db.get_default("currency_precision")) or 2
 
 	unpaid_accrued_entries = frappe.db.sql(
 		"""
@@ -1105,7 +1146,9 @@ def get_amounts(amounts, against_loan, posting_date, with_loan_details=False):
 
 	against_loan_doc = frappe.get_doc("Loan", against_loan)
 	loan_product_details = frappe.get_doc("Loan Product", against_loan_doc.loan_product)
-	accrued_interest_entries = get_accrued_interest_entries(against_loan_doc.name, posting_date)
+	accrued_interest_entries = get_accrued_interest_entries(
+		against_loan_doc.name, posting_date, precision
+	)
 
 	computed_penalty_date, pending_penalty_amount = get_penalty_details(against_loan)
 	pending_accrual_entries = {}
@@ -1233,9 +1276,15 @@ def calculate_amounts(against_loan, posting_date, payment_type="", with_loan_det
 
 	amounts["charges"] = charges
 	amounts["payable_amount"] += amounts["total_charges_payable"]
-	amounts["available_security_deposit"] = frappe.db.get_value(
-		"Loan Security Deposit", {"loan": against_loan}, "sum(deposit_amount - allocated_amount)"
+
+	security_deposit = frappe.qb.DocType("Loan Security Deposit")
+	available_security_deposit = (
+		frappe.qb.from_(security_deposit)
+		.select(Sum(security_deposit.deposit_amount - security_deposit.allocated_amount))
+		.where(security_deposit.loan == against_loan)
+		.run()
 	)
+	amounts["available_security_deposit"] = available_security_deposit[0][0]
 
 	# update values for closure
 	if payment_type == "Loan Closure":
@@ -664,9 +664,10 @@ class LoanRestructure(AccountsController):
 			)
 
 	def cancel_loan_adjustments(self):
-		for d in frappe.get_all("Loan Repayment", {"loan_restructure": self.name}):
-			doc = frappe.get_doc("Loan Repayment", d.name)
-			doc.cancel()
+		for name in frappe.get_all(
+			"Loan Repayment", {"loan_restructure": self.name, "docstatus": 1}, pluck="name"
+		):
+			frappe.get_doc("Loan Repayment", name).cancel()
 
 	def make_loan_adjustment_for_capitalization(self):
 		if self.balance_interest_amount and self.treatment_of_normal_interest == "Capitalize":
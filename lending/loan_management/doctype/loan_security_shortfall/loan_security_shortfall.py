@@ -64,7 +64,7 @@ def check_for_ltv_shortfall(process_loan_security_shortfall):
 
 	update_time = get_datetime()
 
-	loan_security_price_map = frappe._dict(
+	loan_security_price_map = dict(
 		frappe.get_all(
 			"Loan Security Price",
 			fields=["loan_security", "loan_security_price"],
@@ -87,12 +87,21 @@ def check_for_ltv_shortfall(process_loan_security_shortfall):
 		filters={"status": ("in", ["Disbursed", "Partially Disbursed"]), "is_secured_loan": 1},
 	)
 
-	loan_shortfall_map = frappe._dict(
+	loan_shortfall_map = dict(
 		frappe.get_all(
 			"Loan Security Shortfall", fields=["loan", "name"], filters={"status": "Pending"}, as_list=1
 		)
 	)
 
+	# hoisted out of the loop below; get_ltv_ratio fires two queries per loan
+	security_type_map = dict(
+		frappe.get_all("Loan Security", fields=["name", "loan_security_type"], as_list=1)
+	)
+
+	ltv_ratio_map = dict(
+		frappe.get_all("Loan Security Type", fields=["name", "loan_to_value_ratio"], as_list=1)
+	)
+
 	loan_security_map = {}
 
 	for loan in loans:
@@ -111,7 +120,7 @@ def check_for_ltv_shortfall(process_loan_security_shortfall):
 
 		for security, qty in pledged_securities.items():
 			if not ltv_ratio:
-				ltv_ratio = get_ltv_ratio(security)
+				ltv_ratio = ltv_ratio_map.get(security_type_map.get(security))
 			security_value += flt(loan_security_price_map.get(security)) * flt(qty)
 
 		current_ratio = (outstanding_amount / security_value) * 100 if security_value else 0
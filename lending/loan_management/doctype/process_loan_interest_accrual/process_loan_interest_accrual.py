@@ -72,14 +72,21 @@ def process_loan_interest_accrual_for_term_loans(posting_date=None, loan_product
 
 
 def term_loan_accrual_pending(date, loan=None):
-	filters = {"payment_date": ("<=", date), "is_accrued": 0}
+	loan_schedule = frappe.qb.DocType("Loan Repayment Schedule")
+	repayment_schedule = frappe.qb.DocType("Repayment Schedule")
+
+	query = (
+		frappe.qb.from_(repayment_schedule)
+		.inner_join(loan_schedule)
+		.on(repayment_schedule.parent == loan_schedule.name)
+		.select(repayment_schedule.name)
+		.where((repayment_schedule.payment_date <= date) & (repayment_schedule.is_accrued == 0))
+		.limit(1)
+	)
 
 	if loan:
-		loan_repayment_schedule = frappe.db.get_value(
-			"Loan Repayment Schedule", {"loan": loan, "status": "Active"}
-		)
-		filters.update({"parent": loan_repayment_schedule})
+		query = query.where((loan_schedule.loan == loan) & (loan_schedule.status == "Active"))
 
-	pending_accrual = frappe.db.get_value("Repayment Schedule", filters)
+	pending_accrual = query.run()
 
-	return pending_accrual
+	return pending_accrual[0][0] if pending_accrual else None
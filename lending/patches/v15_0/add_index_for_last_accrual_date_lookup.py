@@ -0,0 +1,12 @@
+# Copyright (c) 2023, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+import frappe
+
+
+def execute():
+	# get_last_accrual_date and its batched variant aggregate
+	# MAX(posting_date) filtered by loan and docstatus on every accrual and
+	# repayment; a composite index lets the database resolve that without a
+	# table scan
+	frappe.db.add_index("Loan Interest Accrual", ["loan", "docstatus", "posting_date"])